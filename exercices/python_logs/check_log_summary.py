@@ -0,0 +1,134 @@
+"""
+Vérifications de log_summary.py : découpage en tranches, reprise depuis le
+checkpoint, rotation et troncature.
+
+Usage : python check_log_summary.py
+"""
+import os
+import shutil
+import tempfile
+
+from log_summary import LogSummarizer, build_report
+
+LOGS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs.json')
+
+
+def read_logs() -> bytes:
+    with open(LOGS, 'rb') as f:
+        return f.read()
+
+
+def write(path: str, data: bytes, mode: str = 'wb'):
+    with open(path, mode) as f:
+        f.write(data)
+
+
+def full_report(paths, **kwargs):
+    """Rapport d'une exécution complète, sans checkpoint"""
+    return build_report(LogSummarizer(workers=1, **kwargs).summarize(paths))
+
+
+def check_chunks_match_single_pass(tmp: str):
+    """Le découpage en petites tranches donne la même synthèse qu'une lecture d'un bloc"""
+    expected = full_report([LOGS])
+    assert expected['entries'] == 123
+    assert build_report(LogSummarizer(chunk_size=500).summarize([LOGS])) == expected
+
+
+def check_incremental_matches_full(tmp: str):
+    """Une exécution incrémentale sur un fichier complété égale une exécution complète"""
+    data = read_logs()
+    path = os.path.join(tmp, 'app.json')
+    checkpoint = os.path.join(tmp, 'checkpoint.json')
+
+    cut = data.index(b'\n', len(data) // 2) + 1
+    write(path, data[:cut + 40])  # la dernière ligne est en cours d'écriture
+    LogSummarizer(checkpoint, chunk_size=700).summarize([path])
+    write(path, data[cut + 40:], 'ab')
+
+    incremental = build_report(LogSummarizer(checkpoint, chunk_size=700).summarize([path]))
+    assert incremental == full_report([path])
+    assert incremental['entries'] == 123
+
+
+def check_truncated_file_is_reread(tmp: str):
+    """Un fichier tronqué puis réécrit (copytruncate) est relu depuis le début"""
+    data = read_logs()
+    path = os.path.join(tmp, 'app.json')
+    checkpoint = os.path.join(tmp, 'checkpoint.json')
+
+    write(path, data[:data.index(b'\n', 4000) + 1])
+    LogSummarizer(checkpoint).summarize([path])
+    # Même inode, contenu différent qui dépasse l'ancien offset
+    write(path, data[data.index(b'\n', 3000) + 1:])
+
+    assert build_report(LogSummarizer(checkpoint).summarize([path])) == full_report([path])
+
+
+def check_rotation_is_not_reread(tmp: str):
+    """Un fichier renommé par la rotation numérotée n'est pas relu"""
+    data = read_logs()
+    path = os.path.join(tmp, 'app.json')
+    checkpoint = os.path.join(tmp, 'checkpoint.json')
+
+    write(path, data)
+    LogSummarizer(checkpoint).summarize([path])
+    os.rename(path, path + '.1')
+    write(path, data[:data.index(b'\n', 5000) + 1])
+
+    summarizer = LogSummarizer(checkpoint)
+    offsets = {item['path']: item['offset'] for item in summarizer.state.values()}
+    assert offsets == {path: len(data)}
+
+    report = build_report(summarizer.summarize([path, path + '.1']))
+    assert report == full_report([path, path + '.1'])
+
+
+def check_duplicates_and_invalid_lines(tmp: str):
+    """Un fichier donné deux fois n'est compté qu'une fois ; un `ts` invalide est ignoré"""
+    path = os.path.join(tmp, 'app.json')
+    write(path, read_logs() + b'{"ts":"bad","level":"INFO"}\n{"ts":null,"level":"INFO"}\n')
+
+    summary = LogSummarizer().summarize([path, os.path.join(tmp, '.', 'app.json')])
+    assert summary['entries'] == 123
+    assert summary['last'][2]['event'] == 'notify'
+
+
+def check_finished_file_without_newline(tmp: str):
+    """La dernière ligne d'un fichier tourné sans fin de ligne est comptée"""
+    rotated = os.path.join(tmp, 'app.json.1')
+    active = os.path.join(tmp, 'app.json')
+    write(rotated, b'{"ts":"2025-11-07T08:00:00.000Z","level":"INFO","event":"a"}')
+    write(active, b'{"ts":"2025-11-07T08:00:01.000Z","level":"INFO","event":"b"}')
+    os.utime(rotated, (1, 1))
+
+    report = full_report([active, rotated])
+    assert report['entries'] == 1
+    assert report['unique']['event'] == ['a']
+
+
+def check_missing_file_is_reported(tmp: str):
+    """Un fichier disparu est signalé sans interrompre la synthèse"""
+    path = os.path.join(tmp, 'gone.json')
+    report = full_report([LOGS, path])
+    assert report['entries'] == 123
+    assert report['missing_files'] == [path]
+
+
+if __name__ == "__main__":
+    checks = [
+        check_chunks_match_single_pass,
+        check_incremental_matches_full,
+        check_truncated_file_is_reread,
+        check_rotation_is_not_reread,
+        check_duplicates_and_invalid_lines,
+        check_finished_file_without_newline,
+        check_missing_file_is_reported,
+    ]
+    for check in checks:
+        tmp = tempfile.mkdtemp()
+        try:
+            check(tmp)
+        finally:
+            shutil.rmtree(tmp)
+        print(f"OK  {check.__name__}")
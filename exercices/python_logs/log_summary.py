@@ -0,0 +1,405 @@
+"""
+Synthèse parallèle et incrémentale de logs rtpipe (NDJSON) répartis sur
+plusieurs fichiers.
+
+Chaque fichier est découpé en tranches alignées sur les fins de ligne, les
+tranches sont traitées dans un pool de processus et les compteurs partiels
+sont fusionnés. Un checkpoint mémorise, par fichier, l'offset déjà lu et la
+synthèse partielle associée : les exécutions suivantes ne lisent que les
+lignes ajoutées depuis.
+
+Une ligne sans fin de ligne en fin de fichier est considérée en cours
+d'écriture et n'est lue qu'une fois terminée, sauf si le fichier n'est pas le
+plus récent des entrées (fichier déjà tourné, qui ne sera plus complété).
+
+Usage : python log_summary.py logs/*.json [--checkpoint .log_summary.json] [--mail]
+"""
+import argparse
+import hashlib
+import json
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from trace_latency import first_key_wins, safe_parse_ts
+
+CHECKPOINT_VERSION = 3
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+FINGERPRINT_SIZE = 1024
+REPORT_LEVELS = ('INFO', 'WARNING', 'ERROR')
+LEVEL_ALIASES = {'WARN': 'WARNING'}
+
+
+def empty_summary() -> Dict:
+    """Synthèse vide, élément neutre de `merge_summaries`"""
+    return {'entries': 0, 'levels': Counter(), 'events': Counter(), 'last': None}
+
+
+def merge_summaries(left: Dict, right: Dict) -> Dict:
+    """
+    Fusionne deux synthèses. `last` est un triplet (position, horodatage ms,
+    entrée) ; la position la plus grande l'emporte (offset dans un fichier,
+    puis horodatage entre fichiers).
+    """
+    merged = {
+        'entries': left['entries'] + right['entries'],
+        'levels': left['levels'] + right['levels'],
+        'events': left['events'] + right['events'],
+        'last': left['last'],
+    }
+    if right['last'] is not None and (left['last'] is None or right['last'][0] >= left['last'][0]):
+        merged['last'] = right['last']
+    return merged
+
+
+def find_line_start(f, offset: int) -> int:
+    """Retourne le début de la première ligne commençant à `offset` ou après"""
+    if offset == 0:
+        return 0
+    f.seek(offset - 1)
+    f.readline()
+    return f.tell()
+
+
+def complete_end(path: str, start: int, finished: bool = False) -> int:
+    """
+    Offset juste après la dernière fin de ligne, pour ignorer une ligne en
+    cours d'écriture. Un fichier `finished` (déjà tourné) est lu jusqu'au bout.
+    """
+    size = os.path.getsize(path)
+    if finished:
+        return max(size, start)
+    with open(path, 'rb') as f:
+        pos = size
+        while pos > start:
+            step = min(64 * 1024, pos - start)
+            f.seek(pos - step)
+            block = f.read(step)
+            index = block.rfind(b'\n')
+            if index != -1:
+                return pos - step + index + 1
+            pos -= step
+    return start
+
+
+def split_chunks(path: str, start: int, end: int, chunk_size: int) -> List[Tuple[str, int, int]]:
+    """Découpe [start, end) en tranches alignées sur les débuts de ligne"""
+    chunks = []
+    with open(path, 'rb') as f:
+        chunk_start = start
+        while chunk_start < end:
+            chunk_end = min(find_line_start(f, chunk_start + chunk_size), end)
+            chunks.append((path, chunk_start, chunk_end))
+            chunk_start = chunk_end
+    return chunks
+
+
+def summarize_chunk(chunk: Tuple[str, int, int]) -> Optional[Dict]:
+    """
+    Synthèse d'une tranche [start, end) d'un fichier (exécutée dans un worker).
+    Les lignes dont `ts` est illisible sont ignorées ; retourne None si le
+    fichier a disparu entre-temps.
+    """
+    path, start, end = chunk
+    summary = empty_summary()
+    levels = summary['levels']
+    events = summary['events']
+    last_line = None
+    last_ts = None
+
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    with f:
+        f.seek(start)
+        remaining = end - start
+        for raw in f:
+            if remaining <= 0:
+                break
+            remaining -= len(raw)
+            try:
+                entry = json.loads(raw)
+            except ValueError:
+                continue
+            if not isinstance(entry, dict):
+                continue
+            ts = safe_parse_ts(entry.get('ts'))
+            if ts is None:
+                continue
+            summary['entries'] += 1
+            level = entry.get('level')
+            if level:
+                levels[level] += 1
+            event = entry.get('event')
+            if event:
+                events[event] += 1
+            last_line = raw
+            last_ts = ts
+
+    if last_line is not None:
+        # Seule l'entrée conservée est re-décodée avec l'horodatage du log
+        # (`record.parsed` répète la clé `ts`)
+        entry = json.loads(last_line, object_pairs_hook=first_key_wins)
+        ts = safe_parse_ts(entry['ts'])
+        summary['last'] = (start, last_ts if ts is None else ts, entry)
+    return summary
+
+
+def file_key(stat: os.stat_result) -> str:
+    """Identifiant stable d'un fichier à travers les renommages (rotation numérotée)"""
+    return f"{stat.st_dev}:{stat.st_ino}"
+
+
+def fingerprint(path: str, offset: int) -> str:
+    """
+    Empreinte des premiers octets et des octets précédant `offset` : elle
+    change si le fichier a été tronqué puis réécrit (rotation copytruncate).
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        digest.update(f.read(min(FINGERPRINT_SIZE, offset)))
+        tail = max(offset - FINGERPRINT_SIZE, 0)
+        f.seek(tail)
+        digest.update(f.read(offset - tail))
+    return digest.hexdigest()
+
+
+class LogSummarizer:
+    """
+    Synthétise un ensemble de fichiers de logs en s'appuyant sur un
+    checkpoint JSON indexé par (device, inode) : offset, empreinte, chemin
+    et synthèse partielle par fichier.
+    """
+
+    def __init__(self, checkpoint_path: Optional[str] = None,
+                 workers: Optional[int] = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        if chunk_size <= 0:
+            raise ValueError("chunk_size doit être strictement positif")
+        if workers is not None and workers < 1:
+            raise ValueError("workers doit être au moins 1")
+
+        self.checkpoint_path = checkpoint_path
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.state = self.load_checkpoint()
+
+    def load_checkpoint(self) -> Dict:
+        """Charge le checkpoint ; un fichier absent ou illisible repart de zéro"""
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return {}
+        try:
+            with open(self.checkpoint_path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != CHECKPOINT_VERSION:
+                return {}
+
+            state = {}
+            for key, item in data['files'].items():
+                summary = item['summary']
+                state[key] = {
+                    'path': item['path'],
+                    'offset': int(item['offset']),
+                    'fingerprint': item['fingerprint'],
+                    'summary': {
+                        'entries': int(summary['entries']),
+                        'levels': Counter(summary['levels']),
+                        'events': Counter(summary['events']),
+                        'last': self._load_last(summary['last']),
+                    },
+                }
+            return state
+        except (OSError, KeyError, TypeError, ValueError, AttributeError):
+            return {}
+
+    @staticmethod
+    def _load_last(last) -> Optional[Tuple[int, float, Dict]]:
+        """Valide le triplet (offset, horodatage ms, entrée) d'un checkpoint"""
+        if not last:
+            return None
+        offset, ts, entry = last
+        if not isinstance(entry, dict):
+            raise TypeError("entrée invalide dans le checkpoint")
+        return int(offset), float(ts), entry
+
+    def save_checkpoint(self):
+        """Écrit le checkpoint de façon atomique"""
+        if not self.checkpoint_path:
+            return
+        files = {
+            key: {
+                'path': item['path'],
+                'offset': item['offset'],
+                'fingerprint': item['fingerprint'],
+                'summary': {
+                    'entries': item['summary']['entries'],
+                    'levels': dict(item['summary']['levels']),
+                    'events': dict(item['summary']['events']),
+                    'last': item['summary']['last'],
+                },
+            }
+            for key, item in self.state.items()
+        }
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': CHECKPOINT_VERSION, 'files': files}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _resume_offset(self, key: str, path: str, stat: os.stat_result) -> int:
+        """Offset de reprise ; 0 si le fichier est inconnu, tronqué ou réécrit"""
+        item = self.state.get(key)
+        if (item is None or item['offset'] > stat.st_size
+                or fingerprint(path, item['offset']) != item['fingerprint']):
+            self.state.pop(key, None)
+            return 0
+        return item['offset']
+
+    def _prepare(self, key: str, path: str, stat: os.stat_result,
+                 finished: bool) -> Tuple[int, List[Tuple[str, int, int]]]:
+        """Plage à lire pour un fichier : offset de fin et tranches"""
+        start = self._resume_offset(key, path, stat)
+        end = complete_end(path, start, finished)
+        return end, split_chunks(path, start, end, self.chunk_size)
+
+    def summarize(self, paths: List[str]) -> Dict:
+        """
+        Met à jour les synthèses par fichier et retourne la synthèse globale.
+        Les fichiers disparus (rotation en cours) sont ignorés et listés dans
+        `missing`.
+        """
+        files = {}
+        missing = []
+        for path in paths:
+            path = os.path.abspath(path)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                missing.append(path)
+                continue
+            # Un même fichier donné sous plusieurs noms n'est lu qu'une fois
+            files.setdefault(file_key(stat), (path, stat))
+
+        # Seul le fichier le plus récent peut encore recevoir des lignes
+        newest = max((stat.st_mtime for _, stat in files.values()), default=None)
+        pending = {}
+        chunks = []
+        for key, (path, stat) in files.items():
+            try:
+                end, file_chunks = self._prepare(key, path, stat, stat.st_mtime < newest)
+            except FileNotFoundError:
+                missing.append(path)
+                continue
+            pending[key] = (path, end)
+            chunks.extend((key, chunk) for chunk in file_chunks)
+
+        if len(chunks) > 1 and self.workers != 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                partials = list(pool.map(summarize_chunk, [chunk for _, chunk in chunks]))
+        else:
+            partials = [summarize_chunk(chunk) for _, chunk in chunks]
+
+        # Les fichiers absents des entrées (supprimés par la rotation) sont oubliés
+        self.state = {key: item for key, item in self.state.items() if key in pending}
+
+        # Les tranches d'un même fichier sont fusionnées dans l'ordre des offsets
+        for (key, _), partial in zip(chunks, partials):
+            if key not in pending:
+                continue
+            if partial is None:
+                missing.append(pending.pop(key)[0])
+                self.state.pop(key, None)
+                continue
+            item = self.state.setdefault(key, {'summary': empty_summary()})
+            item['summary'] = merge_summaries(item['summary'], partial)
+        for key, (path, end) in pending.items():
+            try:
+                file_fingerprint = fingerprint(path, end)
+            except FileNotFoundError:
+                missing.append(path)
+                self.state.pop(key, None)
+                continue
+            item = self.state.setdefault(key, {'summary': empty_summary()})
+            item['path'] = path
+            item['offset'] = end
+            item['fingerprint'] = file_fingerprint
+
+        self.save_checkpoint()
+
+        total = empty_summary()
+        for item in self.state.values():
+            summary = item['summary']
+            last = summary['last']
+            # Entre fichiers, la dernière entrée est celle de plus grand horodatage
+            position = (last[1], last[1], last[2]) if last else None
+            total = merge_summaries(total, {**summary, 'last': position})
+        total['missing'] = sorted(missing)
+        return total
+
+
+def count_levels(levels: Counter) -> Dict:
+    """Compteurs INFO/WARNING/ERROR, `WARN` étant compté comme `WARNING`"""
+    counts = dict.fromkeys(REPORT_LEVELS, 0)
+    for level, count in levels.items():
+        level = LEVEL_ALIASES.get(level, level)
+        if level in counts:
+            counts[level] += count
+    return counts
+
+
+def build_report(summary: Dict) -> Dict:
+    """Rapport attendu par l'exercice : compteurs, dernière entrée, valeurs uniques"""
+    return {
+        'counts': count_levels(summary['levels']),
+        'last_entry': summary['last'][2] if summary['last'] else None,
+        'unique': {
+            'level': sorted(summary['levels']),
+            'event': sorted(summary['events']),
+        },
+        'entries': summary['entries'],
+        'missing_files': summary.get('missing', []),
+    }
+
+
+def compose_email(report: Dict) -> str:
+    """Rédige la synthèse des logs sous forme de mail"""
+    counts = report['counts']
+    last = report['last_entry'] or {}
+    return f"""Objet : Synthèse des logs rtpipe
+
+Bonjour,
+
+Voici la synthèse des {report['entries']} entrées de logs analysées :
+
+- INFO : {counts['INFO']}
+- WARNING : {counts['WARNING']}
+- ERROR : {counts['ERROR']}
+
+Niveaux rencontrés : {', '.join(report['unique']['level'])}
+Nombre d'événements distincts : {len(report['unique']['event'])}
+
+Dernière entrée ({last.get('ts', 'N/A')}) : [{last.get('level', 'N/A')}] {last.get('event', 'N/A')} - {last.get('msg', '')}
+
+Cordialement,
+"""
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthèse incrémentale de logs rtpipe")
+    parser.add_argument('paths', nargs='*', default=['logs.json'])
+    parser.add_argument('--checkpoint', default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--mail', action='store_true', help="affiche le mail au lieu du JSON")
+    args = parser.parse_args()
+
+    try:
+        summarizer = LogSummarizer(args.checkpoint, args.workers, args.chunk_size)
+    except ValueError as e:
+        parser.error(str(e))
+    report = build_report(summarizer.summarize(args.paths))
+
+    if args.mail:
+        print(compose_email(report))
+    else:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
@@ -0,0 +1,343 @@
+"""
+Reconstruction de la latence par trace à partir des logs rtpipe (NDJSON).
+
+Le fichier est lu en flux, ligne par ligne : chaque événement portant un
+`trace_id` (line.read, record.parsed, enqueue, write.ok, line.oversize) est
+rattaché à sa trace, et les traces incomplètes sont évincées après une fenêtre
+de temps pour garder une mémoire bornée quel que soit le volume de logs.
+
+Usage : python trace_latency.py logs.json [--max-age-ms 60000] [--grace-ms 1000]
+"""
+import argparse
+import json
+import math
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, Optional
+
+START_EVENTS = ('line.read', 'record.parsed', 'enqueue')
+WATERMARK_EVENTS = ('watermark.compute', 'compute.watermark.on.shutdown')
+FLUSH_EVENTS = ('flush', 'flush.on.shutdown', 'no-eligible')
+
+
+def parse_ts(value) -> float:
+    """Convertit un horodatage ISO 8601 (suffixe Z) ou epoch ms en millisecondes epoch"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp() * 1000
+
+
+def safe_parse_ts(value) -> Optional[float]:
+    """Comme `parse_ts`, mais retourne None pour un horodatage absent ou invalide"""
+    try:
+        ts = parse_ts(value)
+    except (ValueError, TypeError, AttributeError, OverflowError):
+        return None
+    return ts if math.isfinite(ts) else None
+
+
+def first_key_wins(pairs) -> Dict:
+    """
+    `record.parsed` répète la clé `ts` (horodatage du log puis de l'événement) :
+    on conserve la première occurrence, celle du log.
+    """
+    entry = {}
+    for key, value in pairs:
+        entry.setdefault(key, value)
+    return entry
+
+
+def iter_entries(lines: Iterable[str]) -> Iterator[Dict]:
+    """Décode les lignes NDJSON en ignorant les lignes vides ou invalides"""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            entry = json.loads(line, object_pairs_hook=first_key_wins)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(entry, dict) and 'ts' in entry:
+            yield entry
+
+
+class LatencyHistogram:
+    """
+    Histogramme à seaux géométriques : la mémoire dépend de l'étendue des
+    valeurs et non du nombre d'échantillons, avec une erreur relative bornée
+    par `precision` sur les percentiles.
+    """
+
+    def __init__(self, precision: float = 0.01):
+        self.precision = precision
+        self._log_base = math.log1p(precision)
+        self.buckets = Counter()
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value: float):
+        """Enregistre une latence (en ms)"""
+        value = max(value, 0.0)
+        index = 0 if value < 1 else math.ceil(math.log(value) / self._log_base)
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Retourne le percentile `p` (0-100), borne haute du seau concerné"""
+        if not self.count:
+            return None
+        rank = math.ceil(p / 100 * self.count) or 1
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                upper = 1.0 if index == 0 else math.exp(index * self._log_base)
+                return round(min(upper, self.max), 3)
+        return round(self.max, 3)
+
+    def summary(self) -> Dict:
+        """Résumé : nombre, moyenne, min/max et percentiles usuels"""
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total / self.count, 3) if self.count else None,
+            'min_ms': round(self.min, 3) if self.min is not None else None,
+            'max_ms': round(self.max, 3) if self.max is not None else None,
+            'p50_ms': self.percentile(50),
+            'p90_ms': self.percentile(90),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+        }
+
+
+class TraceLatencyAnalyzer:
+    """
+    Jointure en flux des événements rtpipe par `trace_id`.
+
+    Une trace est ouverte par le premier événement d'ingestion reçu et fermée
+    par `write.ok` ; la latence ingestion -> émission est l'écart entre les
+    deux. `write.failed` ferme aussi la trace, comptée comme échec d'émission.
+    Les traces restées ouvertes plus de `max_age_ms` (horloge des logs) ou
+    au-delà de `max_pending` sont évincées, chaque cause ayant son compteur.
+
+    Les logs pouvant être légèrement désordonnés, une écriture reçue avant
+    l'ingestion de sa trace est mise en attente `grace_ms` avant d'être
+    comptée comme orpheline, et les événements d'ingestion arrivant après la
+    fermeture d'une trace sont ignorés pendant la même durée.
+    """
+
+    def __init__(self, max_age_ms: float = 60000, max_pending: int = 100000,
+                 grace_ms: float = 1000):
+        if max_age_ms <= 0:
+            raise ValueError("max_age_ms doit être strictement positif")
+        if max_pending <= 0:
+            raise ValueError("max_pending doit être strictement positif")
+        if grace_ms < 0:
+            raise ValueError("grace_ms doit être positif")
+
+        self.max_age_ms = max_age_ms
+        self.max_pending = max_pending
+        self.grace_ms = grace_ms
+        self.pending = OrderedDict()  # trace_id -> ts du premier événement
+        self.early_writes = OrderedDict()  # trace_id -> (événement, ts) reçus avant l'ingestion
+        self.closed = OrderedDict()  # trace_id -> ts de fermeture
+        self.clock = None
+        self.invalid_entries = 0
+
+        self.latency = LatencyHistogram()
+        self.lines_read = 0
+        self.oversize = 0
+        self.skipped = Counter()
+        self.completed = 0
+        self.orphan_writes = 0
+        self.orphan_failures = 0
+        self.failed = 0
+        self.evicted_expired = 0
+        self.evicted_overflow = 0
+
+        self.window_start = None
+        self.windows = 0
+        self.empty_windows = 0
+        self.flushes = 0
+        self.eligible_total = 0
+        self.eligible_max = 0
+        self.heap_len_after_max = 0
+        self.flush_lag = LatencyHistogram()
+        self.watermark_delay = LatencyHistogram()
+
+    def feed(self, entry: Dict):
+        """Traite un événement de log décodé"""
+        ts = safe_parse_ts(entry.get('ts'))
+        if ts is None:
+            self.invalid_entries += 1
+            return
+        # Les logs peuvent être légèrement désordonnés : l'horloge ne recule pas
+        self.clock = ts if self.clock is None else max(self.clock, ts)
+
+        event = entry.get('event')
+        trace_id = entry.get('trace_id')
+
+        if event == 'line.read':
+            self.lines_read += 1
+        elif event == 'line.oversize':
+            self.oversize += 1
+        elif event == 'line.skipped':
+            self.skipped[entry.get('reason', 'unknown')] += 1
+        elif event in WATERMARK_EVENTS:
+            self._open_window(entry, ts)
+        elif event in FLUSH_EVENTS:
+            self._close_window(entry, ts)
+
+        if trace_id:
+            self._track(trace_id, event, ts)
+
+        self._evict()
+
+    def _track(self, trace_id: str, event: str, ts: float):
+        """Met à jour l'état de la trace `trace_id`"""
+        if event in START_EVENTS:
+            if trace_id in self.pending or trace_id in self.closed:
+                return
+            early = self.early_writes.pop(trace_id, None)
+            if early is None:
+                self.pending[trace_id] = ts
+            else:
+                self._close(trace_id, early[0], ts, early[1])
+        elif event in ('write.ok', 'write.failed'):
+            start = self.pending.pop(trace_id, None)
+            if start is not None:
+                self._close(trace_id, event, start, ts)
+            elif trace_id not in self.closed and trace_id not in self.early_writes:
+                self.early_writes[trace_id] = (event, ts)
+        elif event == 'line.skipped':
+            # Ligne abandonnée à l'ingestion : la trace ne sera jamais émise
+            self.pending.pop(trace_id, None)
+
+    def _close(self, trace_id: str, event: str, start: float, end: float):
+        """Ferme une trace dont l'ingestion et l'écriture ont été vues"""
+        self.closed[trace_id] = self.clock
+        if event == 'write.ok':
+            self.completed += 1
+            self.latency.add(end - start)
+        else:
+            self.failed += 1
+
+    def _count_orphan(self, event: str):
+        """Compte une écriture dont la trace n'a jamais été ingérée"""
+        if event == 'write.ok':
+            self.orphan_writes += 1
+        else:
+            self.orphan_failures += 1
+
+    def _evict(self):
+        """Évince les traces incomplètes trop anciennes ou en surnombre"""
+        horizon = self.clock - self.max_age_ms
+        while self.pending:
+            trace_id, start = next(iter(self.pending.items()))
+            if start < horizon:
+                self.evicted_expired += 1
+            elif len(self.pending) > self.max_pending:
+                self.evicted_overflow += 1
+            else:
+                break
+            del self.pending[trace_id]
+
+        grace_horizon = self.clock - self.grace_ms
+        while self.early_writes:
+            trace_id, (event, ts) = next(iter(self.early_writes.items()))
+            if ts >= grace_horizon and len(self.early_writes) <= self.max_pending:
+                break
+            del self.early_writes[trace_id]
+            self._count_orphan(event)
+        while self.closed:
+            trace_id, ts = next(iter(self.closed.items()))
+            if ts >= grace_horizon and len(self.closed) <= self.max_pending:
+                break
+            del self.closed[trace_id]
+
+    def _open_window(self, entry: Dict, ts: float):
+        """Ouvre une fenêtre de flush au calcul du watermark"""
+        self.window_start = ts
+        now = safe_parse_ts(entry.get('now'))
+        watermark = safe_parse_ts(entry.get('watermark'))
+        if now is not None and watermark is not None:
+            self.watermark_delay.add(now - watermark)
+
+    def _close_window(self, entry: Dict, ts: float):
+        """Ferme la fenêtre courante sur un flush ou une absence d'éligibles"""
+        self.windows += 1
+        if self.window_start is not None:
+            self.flush_lag.add(ts - self.window_start)
+            self.window_start = None
+
+        eligible = entry.get('eligible', 0) if entry.get('event') != 'no-eligible' else 0
+        if not eligible:
+            self.empty_windows += 1
+            return
+
+        self.flushes += 1
+        self.eligible_total += eligible
+        self.eligible_max = max(self.eligible_max, eligible)
+        self.heap_len_after_max = max(self.heap_len_after_max, entry.get('heap_len_after', 0))
+
+    def report(self) -> Dict:
+        """Construit le rapport de latence, d'abandons et de fenêtres"""
+        # Les écritures encore en attente d'ingestion sont orphelines à ce stade
+        early = Counter(event for event, _ in self.early_writes.values())
+        return {
+            'invalid_entries': self.invalid_entries,
+            'latency': self.latency.summary(),
+            'traces': {
+                'completed': self.completed,
+                'pending': len(self.pending),
+                'failed': self.failed,
+                'evicted_expired': self.evicted_expired,
+                'evicted_overflow': self.evicted_overflow,
+                'orphan_writes': self.orphan_writes + early['write.ok'],
+                'orphan_failures': self.orphan_failures + early['write.failed'],
+            },
+            'oversize': {
+                'lines_read': self.lines_read,
+                'oversize': self.oversize,
+                'skipped': dict(self.skipped),
+                'drop_rate': round(self.oversize / self.lines_read, 4) if self.lines_read else 0.0,
+            },
+            'windows': {
+                'count': self.windows,
+                'flushes': self.flushes,
+                'empty': self.empty_windows,
+                'eligible_total': self.eligible_total,
+                'eligible_mean': round(self.eligible_total / self.flushes, 2) if self.flushes else 0.0,
+                'eligible_max': self.eligible_max,
+                'heap_len_after_max': self.heap_len_after_max,
+                'flush_lag': self.flush_lag.summary(),
+                'watermark_delay': self.watermark_delay.summary(),
+            },
+        }
+
+
+def analyze_file(path: str, max_age_ms: float = 60000, max_pending: int = 100000,
+                 grace_ms: float = 1000) -> Dict:
+    """Analyse un fichier de logs rtpipe et retourne le rapport"""
+    analyzer = TraceLatencyAnalyzer(max_age_ms=max_age_ms, max_pending=max_pending,
+                                    grace_ms=grace_ms)
+    with open(path, encoding='utf-8') as f:
+        for entry in iter_entries(f):
+            analyzer.feed(entry)
+    return analyzer.report()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latence par trace des logs rtpipe")
+    parser.add_argument('path', nargs='?', default='logs.json')
+    parser.add_argument('--max-age-ms', type=float, default=60000)
+    parser.add_argument('--max-pending', type=int, default=100000)
+    parser.add_argument('--grace-ms', type=float, default=1000)
+    args = parser.parse_args()
+
+    report = analyze_file(args.path, args.max_age_ms, args.max_pending, args.grace_ms)
+    print(json.dumps(report, indent=2, ensure_ascii=False))